@@ -1,17 +1,181 @@
 import os.path
+import hashlib
+import queue
+import threading
 import cv2
+import numpy as np
 from tools.log_mode import LogManager
 from argparse import ArgumentParser
 import time
 import platform
 import psutil
 import torch
+import torch.nn.functional as F
 import yaml
+from PIL import Image
+from torchvision.io import ImageReadMode, decode_jpeg, read_file
 from tqdm import tqdm
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Dict, Iterator, List, Optional
 
 from ultralytics import SAM, __version__ as ultralytics_version
-from ultralytics.models.sam import SAM2VideoPredictor, SAM2DynamicInteractivePredictor
+from ultralytics.data.utils import IMG_FORMATS
+from ultralytics.engine.results import Results
+from ultralytics.utils import TORCHVISION_VERSION
+from ultralytics.utils.checks import check_version
+from ultralytics.utils.patches import imread
+from ultralytics.utils.torch_utils import TORCH_2_1
+from ultralytics.models.sam import Predictor, SAM2Predictor, SAM2VideoPredictor, SAM2DynamicInteractivePredictor
+
+_SENTINEL = object()  # 流水线队列结束标记
+TORCHVISION_0_19 = check_version(TORCHVISION_VERSION, "0.19.0")  # decode_jpeg 支持整批 GPU 解码
+
+# 预热 CPU 使用率采样：之后 cpu_percent(interval=None) 返回自此以来的使用率，无需阻塞等待
+psutil.cpu_percent(interval=None)
+
+
+class FrameSource:
+    """视频抽帧迭代器：grab() 推进每一帧，仅对采样帧 retrieve() 解码，跳过帧不做颜色转换"""
+
+    def __init__(self, path: str, frame_interval: int = 1, target_fps: float = None):
+        """
+        :param path: 视频文件路径
+        :param frame_interval: 采样间隔（每隔多少帧取一帧），未指定 target_fps 时生效
+        :param target_fps: 目标采样帧率，指定后按 源帧率/目标帧率 计算采样间隔
+        """
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        assert self.cap.isOpened(), f"视频打开失败：{path}"
+        # 解码缓冲区只保留 1 帧，避免提前解码不需要的帧
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0  # 部分容器读不到帧率，按 30fps 兜底
+        self.frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if target_fps:
+            self.stride = max(1, round(self.fps / target_fps))
+        else:
+            self.stride = max(1, int(frame_interval))
+
+    @property
+    def total(self) -> Optional[int]:
+        """
+        采样后的帧数（依赖容器记录的总帧数，仅用于进度显示）
+        webm / 流式视频等未记录时长的容器可能读到 0 或负数，此时返回 None 表示未知
+        """
+        if self.frames <= 0:
+            return None
+        return (self.frames + self.stride - 1) // self.stride
+
+    def __iter__(self):
+        """逐帧 grab()，命中采样间隔时才 retrieve()，返回 (原视频帧序号, BGR图像)"""
+        frame_idx = 0
+        while self.cap.grab():
+            if frame_idx % self.stride == 0:
+                ok, frame = self.cap.retrieve()
+                if not ok:
+                    break
+                yield frame_idx, frame
+            frame_idx += 1
+
+    def release(self):
+        """释放视频句柄"""
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class EmbeddingCache:
+    """图像编码器特征的磁盘缓存：按 letterbox 后的图像内容哈希索引，同一张图更换提示时跳过编码器"""
+
+    def __init__(self, cache_dir: str, tag: str = ""):
+        """
+        :param cache_dir: 缓存目录
+        :param tag: 模型标识（如权重文件名），避免不同模型共用同一份特征
+        """
+        self.cache_dir = cache_dir
+        self.tag = tag
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, image: np.ndarray, fp16: bool = False) -> str:
+        """
+        根据 letterbox 后、上传显存前的 uint8 图像生成缓存键（包含模型标识、形状与特征精度）
+        在主机端计算，命中与否都不需要把编码器输入拷回 CPU，也不会触发 GPU 同步
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.tag}|{image.shape}|{'fp16' if fp16 else 'fp32'}".encode())
+        h.update(np.ascontiguousarray(image).data)
+        return h.hexdigest()
+
+    def load(self, key: str, device):
+        """读取缓存特征，未命中时返回 None"""
+        path = os.path.join(self.cache_dir, f"{key}.pt")
+        if not os.path.exists(path):
+            return None
+        return torch.load(path, map_location=device)
+
+    def save(self, key: str, features):
+        """保存特征（先写临时文件再重命名，避免中断时留下损坏的缓存）"""
+        path = os.path.join(self.cache_dir, f"{key}.pt")
+        torch.save(features, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+
+class _EmbeddingCacheMixin:
+    """为 SAM 预测器的 get_im_features 增加磁盘缓存"""
+
+    def __init__(self, *args, embedding_cache: EmbeddingCache = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.embedding_cache = embedding_cache
+        self._cache_src = None  # 最近一次 letterbox 后的 uint8 图像，作为缓存键的来源
+
+    def pre_transform(self, im):
+        letterboxed = super().pre_transform(im)
+        self._cache_src = letterboxed[0]
+        return letterboxed
+
+    def get_im_features(self, im):
+        src, self._cache_src = self._cache_src, None
+        if self.embedding_cache is None or src is None:
+            return super().get_im_features(im)
+        key = self.embedding_cache.key(src, self.model.fp16)
+        features = self.embedding_cache.load(key, self.device)
+        if features is None:
+            features = super().get_im_features(im)
+            self.embedding_cache.save(key, features)
+        return features
+
+    def reset_image(self):
+        super().reset_image()
+        self._cache_src = None
+
+
+class CachedPredictor(_EmbeddingCacheMixin, Predictor):
+    """带特征缓存的 SAM / MobileSAM 预测器"""
+
+
+class CachedSAM2Predictor(_EmbeddingCacheMixin, SAM2Predictor):
+    """带特征缓存的 SAM2 图像预测器"""
+
+
+class CachedSAM(SAM):
+    """SAM 模型封装：预测器替换为带特征缓存的版本"""
+
+    def __init__(self, model: str, embedding_cache: EmbeddingCache):
+        super().__init__(model)
+        self.embedding_cache = embedding_cache
+
+    @property
+    def task_map(self):
+        predictor = CachedSAM2Predictor if self.is_sam2 else CachedPredictor
+        return {"segment": {"predictor": partial(predictor, embedding_cache=self.embedding_cache)}}
+
 
 class SAMPredictor:
     # 明确声明初始化需要的参数
@@ -22,20 +186,65 @@ class SAMPredictor:
     def __init__(self, model_path: str,
                  log_manager: LogManager = None,
                  mode: str = "image",
+                 frame_interval: int = 1,
+                 target_fps: float = None,
+                 prefetch: int = 4,
+                 fp16_video: bool = True,
+                 memory_window: int = 16,
+                 embedding_cache_dir: str = None,
+                 batch_size: int = 4,
+                 gpu_jpeg_decode: bool = False,
+                 compile_encoder: bool = False,
                  ):
         self.log_manager = log_manager
 
         self.mode =  mode
+        # 视频抽帧参数（video / DynVideo 模式生效）
+        self.frame_interval = frame_interval
+        self.target_fps = target_fps
+        # 读取/写出队列长度（至少为 2，保证提前结束时读取线程能放入结束标记）
+        self.prefetch = max(2, prefetch)
+        # 视频模式记忆库逐帧缓存特征，fp16 权重+输入可使显存占用减半（仅 GPU 生效）
+        self.half = fp16_video and torch.cuda.is_available()
+        # video 模式记忆库保留的最近帧数（SAM2 最多回看 16 帧的目标指针，更小的窗口会影响跟踪效果）
+        self.memory_window = memory_window
+        # img 模式输入为目录/列表时，每批送入编码器的图像数
+        self.batch_size = max(1, batch_size)
+        # 批量路径的 JPEG 是否用 nvJPEG 在 GPU 上解码（需回传原图到 CPU，收益待与 cv2 路径实测对比，默认关闭）
+        self.gpu_jpeg_decode = gpu_jpeg_decode
+        # 批量路径的锁页内存中转缓冲区、拷贝流及各槽位的拷贝完成事件（首次使用 GPU 时创建）
+        self._staging = None
+        self._copy_stream = None
+        self._copy_events = [None, None]
+        # 批量路径的预读线程：当前批推理时读取下一批
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=1)
+        # 图像编码器是否已 torch.compile（编译后批量路径按固定 batch_size 送入编码器）
+        self._encoder_compiled = False
+        # 输入尺寸固定为 imgsz=1024，让 cuDNN 首次调用时选定最快的卷积算法并复用
+        torch.backends.cudnn.benchmark = True
+        # Ampere 及以上 GPU 的 fp32 矩阵乘/卷积使用 TF32 张量核
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
         load_model_start = time.time()
         self.log_manager.debug("🚀 开始加载SAM模型...")
         if mode in ["image", "img"]:
-            self.model = SAM(model_path)
+            if embedding_cache_dir:
+                # 同一张图多次更换提示时复用编码器特征
+                self.log_manager.debug(f"🚀 启用编码器特征缓存: {embedding_cache_dir}")
+                embedding_cache = EmbeddingCache(embedding_cache_dir, tag=os.path.basename(model_path))
+                self.model = CachedSAM(model_path, embedding_cache)
+            else:
+                self.model = SAM(model_path)
             # 检查模型是否加载成功
 
         elif mode == "video":
             self.log_manager.debug(f"🚀 模式为{mode}，model为{model_path}，处理视频模式...")
-            overrides = dict(conf=0.25, task="segment", mode="predict", imgsz=1024, model=model_path)
+            overrides = dict(conf=0.25, task="segment", mode="predict", imgsz=1024, model=model_path,
+                             half=self.half)
             self.model = SAM2VideoPredictor(overrides=overrides)
+            # 每帧推理结束后裁剪记忆库，显存占用不再随视频长度线性增长
+            self.model.add_callback("on_predict_batch_end",
+                                    lambda predictor: self._prune_state(predictor.dataset.frame))
             # overrides = dict(conf=0.25, task="segment", mode="predict", imgsz=1024, model="sam2_b.pt")
             # predictor = SAM2VideoPredictor(overrides=overrides)
         elif mode == "DynVideo":
@@ -43,37 +252,400 @@ class SAMPredictor:
             log_manager.info(f"model_path: {model_path}")
             # overrides = dict(conf=0.01, task="segment", mode="predict", imgsz=1024, model=model_path, save=False)
             # self.model = SAM2DynamicInteractivePredictor(overrides)
-            overrides = dict(conf=0.01, task="segment", mode="predict", imgsz=1024, model="sam2_t.pt", save=False)
+            overrides = dict(conf=0.01, task="segment", mode="predict", imgsz=1024, model="sam2_t.pt", save=False,
+                             half=self.half)
             self.model = SAM2DynamicInteractivePredictor(overrides=overrides, max_obj_num=10)
 
         assert self.model is not None, f"SAM模型加载失败，model_path: {model_path}"
         load_model_elapsed = time.time() - load_model_start
         self.log_manager.debug(f"✅ 模型加载完成 | 耗时: {load_model_elapsed:.2f}s")
+        if mode in ["video", "DynVideo"]:
+            self.log_manager.debug(f"🚀 视频推理精度: {'fp16' if self.half else 'fp32'}")
+        if compile_encoder:
+            self._compile_encoder()
 
 
+    def _compile_encoder(self):
+        """torch.compile 编译图像编码器：输入尺寸固定，编译一次后所有图像/帧/提示复用，启动时用假输入预热"""
+        if not TORCH_2_1:
+            self.log_manager.warning(f"⚠️  torch {torch.__version__} 低于 2.1，跳过图像编码器编译")
+            return
+        compile_start = time.time()
+        if self.mode in ["image", "img"]:
+            sam_model = self._image_predictor().model  # 创建预测器时模型已移动到推理设备
+        else:
+            if self.model.model is None:
+                self.model.setup_model(model=None, verbose=False)  # 视频预测器默认首次推理时才构建模型
+            sam_model = self.model.model
+        sam_model.image_encoder = torch.compile(sam_model.image_encoder, dynamic=False)
+
+        param = next(sam_model.parameters())
+        # img 模式的目录/列表输入按 batch_size 整批编码（尾批补齐到同一形状），单张图像与视频帧按 1 张编码，
+        # 两种形状都在启动时预热，真实输入不再触发编译
+        warmup_sizes = sorted({1, self.batch_size}) if self.mode in ["image", "img"] else [1]
+        for n in warmup_sizes:
+            # dynamic=False 已按静态形状特化全部维度，预热得到的图可被后续同形状输入直接复用
+            dummy = torch.zeros((n, 3, 1024, 1024), dtype=param.dtype, device=param.device)
+            with torch.inference_mode():
+                sam_model.image_encoder(dummy)
+        self._encoder_compiled = True
+        self.log_manager.debug(f"✅ 图像编码器编译完成 | 耗时: {time.time() - compile_start:.2f}s")
+
+    @torch.inference_mode()
     def __call__(self, input_data,
                  bboxes: List[List[int]] = None,
                  points: List[List[int]] = None,
-                 labels: List[int] = None):
+                 labels: List[int] = None,
+                 save_dir: str = None) -> Iterator[Results]:
+        """
+        逐帧/逐张产出推理结果（生成器），长视频不会同时持有所有帧的掩码
+        :param save_dir: 结果保存目录，指定时由写出线程按 {序号:06d}.jpg 逐个保存
+        推理全程处于 inference_mode，不记录 autograd 的版本计数与视图信息
+        """
         self.log_manager.debug(f"🚀 模型开始处理...")
-        self.log_manager.debug(f"🚀 input_data: {input_data}")
-        self.log_manager.debug(f"🚀 bboxes: {bboxes}")
-        self.log_manager.debug(f"🚀 points: {points}")
-        self.log_manager.debug(f"🚀 labels: {labels}")
-        return self.model(input_data, points=points, labels=labels)
+        # 惰性格式化：DEBUG 日志未被任何输出接收时不拼接字符串
+        self.log_manager.debug_lazy(lambda: f"🚀 input_data: {input_data}")
+        self.log_manager.debug_lazy(lambda: f"🚀 bboxes: {bboxes}")
+        self.log_manager.debug_lazy(lambda: f"🚀 points: {points}")
+        self.log_manager.debug_lazy(lambda: f"🚀 labels: {labels}")
+        results = self._predict(input_data, bboxes=bboxes, points=points, labels=labels)
+        if save_dir is None:
+            yield from results
+            return
+
+        # 写出线程与推理并行保存结果，队列有界，保存跟不上时推理等待而不是堆积结果
+        write_q = queue.Queue(maxsize=self.prefetch)
+        writer = threading.Thread(target=self._write_results, args=(write_q, save_dir), daemon=True)
+        writer.start()
+        try:
+            for idx, result in enumerate(results):
+                write_q.put((idx, result))
+                yield result
+        finally:
+            write_q.put(_SENTINEL)
+            writer.join()
+
+    def _predict(self, input_data,
+                 bboxes: List[List[int]] = None,
+                 points: List[List[int]] = None,
+                 labels: List[int] = None) -> Iterator[Results]:
+        """按模式分派推理，均以流式方式产出结果"""
+        if self.mode == "video":
+            # SAM2VideoPredictor 依赖 video 数据集维护帧状态，仍传入视频路径；
+            # 采样间隔交给 ultralytics 视频加载器的 vid_stride（其内部同样是 grab()+retrieve()）
+            with FrameSource(input_data, self.frame_interval, self.target_fps) as source:
+                self.log_manager.debug(f"🎬 视频帧率: {source.fps:.2f} | 采样间隔: {source.stride}")
+                self.model.args.vid_stride = source.stride
+        elif self.mode == "DynVideo":
+            return self._predict_dyn_video(input_data, bboxes=bboxes, points=points, labels=labels)
+        elif points is not None:
+            # 多张图像：整批过一次编码器，再逐张运行轻量的提示编码器+解码器
+            # （无提示时走 ultralytics 的全图分割，其内部按裁剪块重新编码，不适用批量路径）
+            images = self._list_images(input_data)
+            if images is not None and len(images) > 1:
+                return self._predict_image_batch(images, points=points, labels=labels)
+        return self.model(input_data, stream=True, points=points, labels=labels)
+
+    @staticmethod
+    def _list_images(input_data):
+        """把目录 / 列表输入展开为图像列表（路径或 BGR 数组），单张图像输入返回 None"""
+        if isinstance(input_data, (list, tuple)):
+            return list(input_data)
+        if isinstance(input_data, str) and os.path.isdir(input_data):
+            return [os.path.join(input_data, f) for f in sorted(os.listdir(input_data))
+                    if f.rsplit(".", 1)[-1].lower() in IMG_FORMATS]
+        return None
+
+    @staticmethod
+    def _imread(image):
+        """读取单张图像，已是数组时直接返回（与 ultralytics 加载器同样使用 patches.imread，支持中文路径与多页 tif）"""
+        if isinstance(image, np.ndarray):
+            return image
+        im = imread(image)
+        assert im is not None, f"图像读取失败：{image}"
+        return im
+
+    @staticmethod
+    def _is_jpeg(image) -> bool:
+        """是否为 JPEG 文件路径（可走 GPU 硬件解码）"""
+        return isinstance(image, str) and image.rsplit(".", 1)[-1].lower() in {"jpg", "jpeg"}
+
+    @staticmethod
+    def _exif_orientation(path: str) -> int:
+        """读取 JPEG 的 EXIF 方向标记（只解析文件头，不解码像素），1 表示无需旋转，读取失败返回 0"""
+        try:
+            with Image.open(path) as img:
+                return img.getexif().get(0x0112, 1)
+        except Exception:
+            return 0
+
+    @staticmethod
+    def _decode_jpeg_batch(predictor, datas: list):
+        """
+        JPEG 在 GPU 上解码（nvJPEG），letterbox 与归一化也在 GPU 完成，解码后的图像无需再做 H2D 拷贝
+        注意：nvJPEG 不处理 EXIF 方向，调用方需保证输入无旋转标记；结果后处理所需的原图仍要整张回传 CPU
+        :param datas: read_file 读取的 JPEG 文件字节（uint8 张量）
+        :return: (BGR 原图列表，供结果后处理/保存使用, 预处理后的编码器输入)
+        """
+        if TORCHVISION_0_19:
+            decoded = decode_jpeg(datas, mode=ImageReadMode.RGB, device=predictor.device)
+        else:
+            decoded = [decode_jpeg(data, mode=ImageReadMode.RGB, device=predictor.device) for data in datas]
+        # 结果的坐标还原与绘制依赖 CPU 上的原图（RGB CHW -> BGR HWC）
+        batch = [img.flip(0).permute(1, 2, 0).contiguous().cpu().numpy() for img in decoded]
+        if predictor.imgsz is None:
+            predictor.setup_source(batch[0])  # 初始化 imgsz 等数据源相关属性
+
+        # 与 ultralytics LetterBox(auto=False, center=False) 一致：等比缩放后在右/下方填充 114
+        new_h, new_w = predictor.imgsz
+        im = torch.full((len(decoded), 3, new_h, new_w), 114.0, device=predictor.device)
+        for k, img in enumerate(decoded):
+            h, w = img.shape[1:]
+            r = min(new_h / h, new_w / w)
+            unpad_h, unpad_w = round(h * r), round(w * r)
+            img = img[None].float()
+            if (unpad_h, unpad_w) != (h, w):
+                img = F.interpolate(img, size=(unpad_h, unpad_w), mode="bilinear", align_corners=False)
+            im[k, :, :unpad_h, :unpad_w] = img[0]
+        im = (im - predictor.mean) / predictor.std
+        return batch, (im.half() if predictor.model.fp16 else im)
+
+    def _image_predictor(self):
+        """获取 SAM 封装内部的预测器，首次使用时按 SAM.predict 的默认参数创建"""
+        if self.model.predictor is None:
+            args = {**self.model.overrides, "conf": 0.25, "batch": 1, "save": False, "mode": "predict",
+                    "rect": True, "task": "segment", "imgsz": 1024}
+            predictor = self.model.task_map["segment"]["predictor"](overrides=args, _callbacks=self.model.callbacks)
+            predictor.setup_model(model=self.model.model, verbose=False)
+            self.model.predictor = predictor
+        return self.model.predictor
+
+    def _preprocess_batch(self, predictor, letterboxed: list, slot: int = 0) -> torch.Tensor:
+        """
+        批量预处理（与 Predictor.preprocess 一致，但其 pre_transform 只接受单张图，由调用方逐张 letterbox 后在此堆叠）
+        GPU 上经锁页内存中转：letterbox 结果写入双缓冲的锁页区，在独立 CUDA 流上异步拷贝到显存，
+        颜色通道转换与归一化在 GPU 上完成，CPU 不等待拷贝即可准备下一批
+        :param letterboxed: 逐张 letterbox 后的 BGR uint8 图像
+        :param slot: 使用的锁页缓冲区槽位（0/1 交替），当前批拷贝时另一槽位可被写入
+        """
+        if predictor.device.type != "cuda":
+            im = np.ascontiguousarray(np.stack(letterboxed)[..., ::-1].transpose((0, 3, 1, 2)))  # BGR->RGB, BHWC->BCHW
+            im = torch.from_numpy(im).to(predictor.device)
+        else:
+            if self._staging is None:
+                # uint8 原图大小的锁页缓冲区：(槽位, batch, H, W, C)，只在首次使用时分配
+                self._staging = torch.empty((2, self.batch_size, *letterboxed[0].shape), dtype=torch.uint8,
+                                            pin_memory=True)
+                self._copy_stream = torch.cuda.Stream(device=predictor.device)
+            if self._copy_events[slot] is not None:
+                self._copy_events[slot].synchronize()  # 该槽位上一次的拷贝完成后才能覆盖
+            staging = self._staging[slot, :len(letterboxed)]
+            for k, x in enumerate(letterboxed):
+                staging[k].copy_(torch.from_numpy(x))
+
+            with torch.cuda.stream(self._copy_stream):
+                im = staging.to(predictor.device, non_blocking=True)
+                self._copy_events[slot] = torch.cuda.Event()
+                self._copy_events[slot].record(self._copy_stream)
+            torch.cuda.current_stream(predictor.device).wait_stream(self._copy_stream)
+            im.record_stream(torch.cuda.current_stream(predictor.device))
+            im = im.permute(0, 3, 1, 2).flip(1)  # BHWC->BCHW, BGR->RGB
+        im = (im - predictor.mean) / predictor.std
+        return im.half() if predictor.model.fp16 else im.float()
+
+    def _encode_batch(self, predictor, im: torch.Tensor) -> list:
+        """整批图像一次前向编码，返回逐张图像的特征（格式与 predictor.get_im_features 的单图输出一致）"""
+        n = len(im)
+        if self._encoder_compiled and n < self.batch_size:
+            # 编译后的编码器按 batch_size 特化：尾批或部分命中缓存的批次补零到同一形状，避免重新编译
+            im = torch.cat([im, im.new_zeros((self.batch_size - n, *im.shape[1:]))])
+        if not isinstance(predictor, SAM2Predictor):
+            # 直接调用基类实现：缓存由 _encode_batch_cached 逐张处理，不能按整批再查一次
+            features = Predictor.get_im_features(predictor, im)
+            return [features[[i]] for i in range(n)]
+
+        # SAM2Predictor.get_im_features 固定按单张图 reshape，这里按批大小展开后再拆分
+        model = predictor.model
+        model.set_imgsz(predictor.imgsz)
+        predictor._bb_feat_sizes = [[x // (4 * i) for x in predictor.imgsz] for i in [1, 2, 4]]
+        backbone_out = model.forward_image(im)
+        _, vision_feats, _, _ = model._prepare_backbone_features(backbone_out)
+        if model.directly_add_no_mem_embed:
+            vision_feats[-1] = vision_feats[-1] + model.no_mem_embed
+        feats = [feat.permute(1, 2, 0).view(len(im), -1, *feat_size)
+                 for feat, feat_size in zip(vision_feats, predictor._bb_feat_sizes)]
+        return [{"image_embed": feats[-1][[i]], "high_res_feats": [feat[[i]] for feat in feats[:-1]]}
+                for i in range(n)]
+
+    def _encode_batch_cached(self, predictor, im: torch.Tensor, letterboxed: list) -> list:
+        """
+        带特征缓存的批量编码：按单张 letterbox 图像逐个查缓存，只把未命中的图像整批送入编码器
+        缓存键与单图路径一致，不受 batch_size 或目录中其他图像影响
+        """
+        cache = getattr(predictor, "embedding_cache", None)
+        if cache is None:
+            return self._encode_batch(predictor, im)
+        keys = [cache.key(x, predictor.model.fp16) for x in letterboxed]
+        features = [cache.load(key, predictor.device) for key in keys]
+        misses = [i for i, f in enumerate(features) if f is None]
+        if misses:
+            for i, f in zip(misses, self._encode_batch(predictor, im[misses])):
+                cache.save(keys[i], f)
+                features[i] = f
+        return features
+
+    def _read_chunk(self, pool: ThreadPoolExecutor, chunk: list, gpu_decode: bool):
+        """
+        读取一批图像：走 GPU 解码时只读取 JPEG 文件字节，否则由 cv2 解码为 BGR 数组
+        cv2 解码会按 EXIF 方向旋转而 nvJPEG 不会，含旋转标记（或无法解析）的批次改由 cv2 解码，保证两条路径像素一致
+        :return: (读取结果列表, 是否走 GPU 解码)
+        """
+        if gpu_decode and any(o != 1 for o in pool.map(self._exif_orientation, chunk)):
+            gpu_decode = False
+        return list(pool.map(read_file if gpu_decode else self._imread, chunk)), gpu_decode
+
+    def _predict_image_batch(self, images: list,
+                             points: List[List[int]] = None,
+                             labels: List[int] = None) -> Iterator[Results]:
+        """
+        img 模式批量推理：线程池并行读图（JPEG 在 GPU 上解码），每 batch_size 张图共用一次编码器前向
+        当前批推理期间，预读线程提前读取下一批图像
+        """
+        predictor = self._image_predictor()
+        predictor.reset_image()
+        chunks = [images[start:start + self.batch_size] for start in range(0, len(images), self.batch_size)]
+        # GPU 解码在显存上 letterbox，没有可作缓存键的主机端图像，启用特征缓存时统一走 cv2 解码
+        use_gpu_decode = (self.gpu_jpeg_decode and predictor.device.type == "cuda"
+                          and getattr(predictor, "embedding_cache", None) is None)
+        gpu_decode = [use_gpu_decode and all(self._is_jpeg(x) for x in chunk) for chunk in chunks]
+
+        # 预测器为 SAM 封装内共享的实例：无论正常结束、调用方提前关闭生成器还是推理抛出异常，
+        # 都要清除预置的输入与特征，否则之后的单图调用会沿用上一张图的特征
+        try:
+            with ThreadPoolExecutor(max_workers=self.batch_size) as pool:
+                future = self._prefetch_pool.submit(self._read_chunk, pool, chunks[0], gpu_decode[0])
+                for chunk_idx in tqdm(range(len(chunks)), desc="img batch"):
+                    loaded, chunk_gpu_decode = future.result()
+                    if chunk_idx + 1 < len(chunks):
+                        future = self._prefetch_pool.submit(self._read_chunk, pool, chunks[chunk_idx + 1],
+                                                            gpu_decode[chunk_idx + 1])
+                    if chunk_gpu_decode:
+                        try:
+                            batch, im = self._decode_jpeg_batch(predictor, loaded)
+                        except RuntimeError as e:
+                            # nvJPEG 不支持的 JPEG（如 CMYK）改用 cv2 解码，不中断整个目录的推理
+                            self.log_manager.warning(f"⚠️  GPU 解码失败，改用 cv2 解码: {e}")
+                            loaded, chunk_gpu_decode = list(pool.map(self._imread, chunks[chunk_idx])), False
+                    if chunk_gpu_decode:
+                        batch_features = self._encode_batch(predictor, im)
+                    else:
+                        # 其他格式（或 CPU 推理）已由 cv2 解码
+                        batch = loaded
+                        if predictor.imgsz is None:
+                            predictor.setup_source(batch[0])  # 初始化 imgsz 等数据源相关属性
+                        letterboxed = [predictor.pre_transform([x])[0] for x in batch]
+                        im = self._preprocess_batch(predictor, letterboxed, slot=chunk_idx % 2)
+                        batch_features = self._encode_batch_cached(predictor, im, letterboxed)
+                    for i, features in enumerate(batch_features):
+                        # 预置单图输入与特征，预测器跳过预处理和编码器，仅运行解码与后处理
+                        predictor.im, predictor.features = im[[i]], features
+                        yield from predictor(source=batch[i], points=points, labels=labels)
+        finally:
+            predictor.reset_image()
+
+    def _predict_dyn_video(self, video_path: str,
+                           bboxes: List[List[int]] = None,
+                           points: List[List[int]] = None,
+                           labels: List[int] = None) -> Iterator[Results]:
+        """
+        DynVideo 模式：首帧写入提示并更新记忆，后续采样帧仅做跟踪
+        读取线程解码采样帧，主线程推理并逐帧产出结果（保存由 __call__ 的写出线程完成），
+        模型调用只在主线程执行，SAM2 的记忆库状态无需加锁
+        """
+        prompts = points if points is not None else bboxes
+        assert prompts is not None, "DynVideo 模式首帧需要 points 或 bboxes 提示"
+        obj_ids = list(range(len(prompts)))
+
+        read_q = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        with FrameSource(video_path, self.frame_interval, self.target_fps) as source:
+            self.log_manager.debug(f"🎬 视频帧率: {source.fps:.2f} | 采样间隔: {source.stride} | 采样帧数: {source.total or '未知'}")
+            reader = threading.Thread(target=self._read_frames, args=(source, read_q, stop), daemon=True)
+            reader.start()
+
+            try:
+                first_frame = True
+                with tqdm(total=source.total, desc="DynVideo") as pbar:
+                    while (item := read_q.get()) is not _SENTINEL:
+                        frame_idx, frame = item
+                        if first_frame:
+                            frame_results = self.model(source=frame, bboxes=bboxes, points=points, labels=labels,
+                                                       obj_ids=obj_ids, update_memory=True)
+                            first_frame = False
+                        else:
+                            frame_results = self.model(source=frame)
+                        pbar.update()
+                        yield from frame_results
+            finally:
+                # 通知读取线程退出，并清空队列解除其阻塞，确保视频句柄释放前线程已结束
+                stop.set()
+                while reader.is_alive():
+                    try:
+                        read_q.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+    def _prune_state(self, frame_idx: int):
+        """
+        裁剪 video 模式（SAM2VideoPredictor）的记忆库：只保留最近 memory_window 帧的非条件帧输出（条件帧即提示帧始终保留）
+        DynVideo 模式的记忆库只在 update_memory=True 的提示帧写入，跟踪帧不会使其增长，无需裁剪
+        """
+        window = self.memory_window
+        inference_state = getattr(self.model, "inference_state", None)
+        if inference_state:
+            # 按帧序号淘汰 output_dict 及各目标切片中的旧帧
+            non_cond_outputs = inference_state["output_dict"]["non_cond_frame_outputs"]
+            for idx in [idx for idx in non_cond_outputs if idx < frame_idx - window]:
+                non_cond_outputs.pop(idx)
+                for obj_output_dict in inference_state["output_dict_per_obj"].values():
+                    obj_output_dict["non_cond_frame_outputs"].pop(idx, None)
+
+    @staticmethod
+    def _read_frames(source: FrameSource, read_q: queue.Queue, stop: threading.Event):
+        """读取线程：解码采样帧放入队列，结束（或被通知停止）时放入结束标记"""
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                read_q.put(item)
+        finally:
+            read_q.put(_SENTINEL)
+
+    def _write_results(self, write_q: queue.Queue, save_dir: str):
+        """写出线程：逐帧保存分割结果，收到结束标记后退出"""
+        while (item := write_q.get()) is not _SENTINEL:
+            frame_idx, result = item
+            save_path = os.path.join(save_dir, f"{frame_idx:06d}.jpg")
+            try:
+                result.save(save_path)
+            except Exception as e:
+                # 单帧保存失败不中断流水线，否则主线程会阻塞在写出队列上
+                self.log_manager.error(f"❌ 结果保存失败 {save_path}: {e}")
 
 
     def __del__(self):
+        self._prefetch_pool.shutdown(wait=False)
         self.log_manager.info("✅ 模型已释放")
+        self.log_manager.complete()
 
 
-def get_system_info() -> Dict[str, str]:
-    """采集系统/硬件核心信息（用于日志输出）"""
-    # CPU信息
+@lru_cache(maxsize=1)
+def _get_static_hw_info() -> Dict[str, Dict[str, str]]:
+    """采集运行期间不会变化的硬件信息（只查询一次）"""
     cpu_info = {
         "型号": platform.processor() or "未知CPU",
         "核心数": f"{psutil.cpu_count(logical=True)} (逻辑) / {psutil.cpu_count(logical=False)} (物理)",
-        "使用率": f"{psutil.cpu_percent(interval=0.1)}%"
     }
 
     # GPU信息（基于PyTorch）
@@ -85,6 +657,20 @@ def get_system_info() -> Dict[str, str]:
         gpu_info["显存"] = f"{torch.cuda.get_device_properties(0).total_memory / 1024 ** 3:.1f}GB"
     else:
         gpu_info["状态"] = "无可用GPU / 使用CPU推理"
+    return {"cpu": cpu_info, "gpu": gpu_info}
+
+
+def get_system_info() -> Dict[str, str]:
+    """采集系统/硬件核心信息（用于日志输出）"""
+    static_info = _get_static_hw_info()
+    # CPU信息（使用率为模块导入以来的非阻塞采样，无需等待 0.1s）
+    cpu_info = {
+        **static_info["cpu"],
+        "使用率": f"{psutil.cpu_percent(interval=None)}%"
+    }
+
+    # GPU信息（基于PyTorch）
+    gpu_info = dict(static_info["gpu"])
 
     # 内存信息
     mem = psutil.virtual_memory()
@@ -134,7 +720,11 @@ def format_inference_args(args_dict: Dict[str, any]) -> str:
     """格式化推理参数（用于日志输出）"""
     formatted = []
     for k, v in args_dict.items():
-        if isinstance(v, list):
+        if isinstance(v, list) and v and all(isinstance(x, float) for x in v):
+            # 纯浮点列表整体交给 numpy 取整
+            formatted.append(f"{k}={np.round(v, 2).tolist()}")
+        elif isinstance(v, list):
+            # 混合类型（含 int / None / 字符串等）逐元素处理，仅对浮点数取整，其余原样保留
             formatted.append(f"{k}={[round(x, 2) if isinstance(x, float) else x for x in v]}")
         else:
             formatted.append(f"{k}={v}")
@@ -172,7 +762,16 @@ if __name__ == "__main__":
     log_manager.set_log_level(args.log_level)
 
     # 初始化预测器（仅传入所需参数）
-    sam_predictor = SAMPredictor(model_path=config["model_path"], mode=args.mode, log_manager=log_manager,)
+    sam_predictor = SAMPredictor(model_path=config["model_path"], mode=args.mode, log_manager=log_manager,
+                                 frame_interval=config.get("frame_interval", 1),
+                                 target_fps=config.get("target_fps"),
+                                 prefetch=config.get("prefetch", 4),
+                                 fp16_video=config.get("fp16_video", True),
+                                 memory_window=config.get("memory_window", 16),
+                                 embedding_cache_dir=config.get("embedding_cache_dir"),
+                                 batch_size=config.get("batch_size", 4),
+                                 gpu_jpeg_decode=config.get("gpu_jpeg_decode", False),
+                                 compile_encoder=config.get("compile_encoder", False))
 
     # 2. 打印系统信息（日志头部）
     print_system_info()
@@ -201,15 +800,15 @@ if __name__ == "__main__":
         log_manager.error(f"❌ 未知模式 {args.mode}，请选择 img, video, DynVideo")
         exit(1)
     assert os.path.exists(input), f"输入文件 {input} 不存在"
-    results = sam_predictor(input, bboxes=config["bboxes"], points=config["points"], labels=config["labels"])
-    log_manager.info(f"✅ 推理完成，共处理 {len(results)} 个样本")
-
-    if len(results) == 1:
-        os.makedirs(config["output_path"], exist_ok=True)
-        assert os.path.exists(config["output_path"]), f"输出路径 {config['output_path']} 不存在"
-        results[0].save(f"{config['output_path']}/result.jpg")
-        log_manager.info(f"✅ 输出文件保存在 {config['output_path']}/result.jpg")
-    elif len(results) > 1:
-        log_manager.warning(f"⚠️  多个结果，请自行处理， 选择模式为 {args.mode}")
+    # 流式推理：结果逐帧产出，由写出线程边推理边保存，不在内存中累积全部结果
+    os.makedirs(config["output_path"], exist_ok=True)
+    num_results = 0
+    for num_results, _ in enumerate(sam_predictor(input, bboxes=config["bboxes"], points=config["points"],
+                                                  labels=config["labels"], save_dir=config["output_path"]), 1):
+        pass
+    log_manager.info(f"✅ 推理完成，共处理 {num_results} 个样本")
+
+    if num_results > 0:
+        log_manager.info(f"✅ 输出文件保存在 {config['output_path']}（按序号命名，如 000000.jpg）")
     else:
         log_manager.error("❌ 未处理任何样本")
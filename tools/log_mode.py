@@ -39,6 +39,11 @@ class LogConfig:
     }
 
 
+# 控制台时间戳缓存：(整秒时间戳, 格式化后的字符串)
+# loguru 在 handler 锁之外调用格式化函数，主线程与读取/写出线程可能同时执行，
+# 因此整体存为一个元组：读取一次到局部变量、整体替换写入，秒数与字符串始终成对
+_ts_cache = (0, "")
+
 
 class LogManager:
     def __init__(self, log_path="./logs/", run_mode="INFO", category="default"):
@@ -59,13 +64,20 @@ class LogManager:
 
         # 确保日志根目录存在
         os.makedirs(self.log_path, exist_ok=True)
+        # 当天日期及日期目录缓存，跨天时才重新创建目录
+        self._cached_date = None
+        self._cached_dir = None
 
         # 保存 handler ID，用于后续动态移除/更新
         self.file_handlers = {}  # 键：日志级别标识，值：handler ID
         self.console_handler_id = None
 
         # 清空 loguru 原有 handler（避免重复输出）
+        # 每个进程只有一个 LogManager，且项目中没有其他模块直接使用 loguru，所有 handler 都由当前实例独占，
+        # 输出端无需再按 category 逐条过滤
         log.remove()
+        # 绑定分类的子 logger，所有日志接口复用，避免每次调用重新 bind
+        self._log = log.bind(category=self.category)
 
         # 1. 配置文件输出（始终保存所有级别日志）
         self._config_file_handlers()
@@ -76,56 +88,19 @@ class LogManager:
         """生成日志文件路径"""
         # 1. 生成当天日期
         log_date = time.strftime("%Y-%m-%d")
-        # 2. 日志日期目录：log_path/YYYY-MM-DD（创建在指定日志根路径下）
-        date_dir = os.path.join(self.log_path, log_date)
-        os.makedirs(date_dir, exist_ok=True)
-        assert os.path.exists(date_dir), f"日志目录创建失败：{date_dir}"
+        # 2. 日志日期目录：log_path/YYYY-MM-DD（创建在指定日志根路径下），同一天内只创建一次
+        if log_date != self._cached_date:
+            date_dir = os.path.join(self.log_path, log_date)
+            os.makedirs(date_dir, exist_ok=True)
+            self._cached_date, self._cached_dir = log_date, date_dir
         # 3. 生成文件名（包含分类、级别、日期）
-        file_name = os.path.join(date_dir, f"{self.category}_{mode}_{log_date}.log")
+        file_name = os.path.join(self._cached_dir, f"{self.category}_{mode}_{log_date}.log")
         return file_name
 
     def _config_file_handlers(self):
-        """配置文件输出：始终保存所有级别的日志（DEBUG/INFO/WARNING/ERROR）"""
-        # ========== ERROR 日志 ==========
-        if "error" in self.file_handlers:
-            log.remove(self.file_handlers["error"])
-        self.file_handlers["error"] = log.add(
-            self._get_log_file_path("error"),
-            rotation=f"{LogConfig.MAX_ROTATION_MB} MB",
-            retention=LogConfig.BACKUP_COUNT,
-            level="ERROR",
-            format=LogConfig.LOG_FORMAT,
-            encoding=LogConfig.ENCODING,
-            filter=lambda record: record["extra"].get("category") == self.category
-        )
-
-        # ========== WARNING 日志 ==========
-        if "warning" in self.file_handlers:
-            log.remove(self.file_handlers["warning"])
-        self.file_handlers["warning"] = log.add(
-            self._get_log_file_path("warning"),
-            rotation=f"{LogConfig.MAX_ROTATION_MB} MB",
-            retention=LogConfig.BACKUP_COUNT,
-            level="WARNING",
-            format=LogConfig.LOG_FORMAT,
-            encoding=LogConfig.ENCODING,
-            filter=lambda record: record["extra"].get("category") == self.category
-        )
-
-        # ========== INFO 日志 ==========
-        if "info" in self.file_handlers:
-            log.remove(self.file_handlers["info"])
-        self.file_handlers["info"] = log.add(
-            self._get_log_file_path("info"),
-            rotation=f"{LogConfig.MAX_ROTATION_MB} MB",
-            retention=LogConfig.BACKUP_COUNT,
-            level="INFO",
-            format=LogConfig.LOG_FORMAT,
-            encoding=LogConfig.ENCODING,
-            filter=lambda record: record["extra"].get("category") == self.category
-        )
-
-        # ========== DEBUG 日志 ==========
+        """配置文件输出：单个 DEBUG 级别文件保存所有级别的日志（DEBUG/INFO/WARNING/ERROR）"""
+        # 只保留一个文件 handler：DEBUG 文件本身已包含所有更高级别的日志，
+        # 按级别拆分多个文件会让每条日志重复写入多次
         if "debug" in self.file_handlers:
             log.remove(self.file_handlers["debug"])
         self.file_handlers["debug"] = log.add(
@@ -135,7 +110,7 @@ class LogManager:
             level="DEBUG",
             format=LogConfig.LOG_FORMAT,
             encoding=LogConfig.ENCODING,
-            filter=lambda record: record["extra"].get("category") == self.category
+            enqueue=True  # 日志经队列交给后台线程写文件，调用方不阻塞在磁盘 I/O 上
         )
 
     def _config_console_handler(self):
@@ -144,17 +119,25 @@ class LogManager:
         if self.console_handler_id is not None:
             log.remove(self.console_handler_id)
 
+        # 颜色映射在配置时取出一次，格式化函数中不再逐条查询 LogConfig
+        color_map = LogConfig.COLOR_MAP
+        reset = color_map["RESET"]
+
         # 自定义彩色格式化函数（WARNING/ERROR整行染色）
         def colored_format(record):
             level = record["level"].name
-            color = LogConfig.COLOR_MAP.get(level, LogConfig.COLOR_MAP["RESET"])
-            reset = LogConfig.COLOR_MAP["RESET"]
+            color = color_map.get(level, reset)
+
+            # 时间戳精确到秒，同一秒内复用上次格式化的字符串
+            global _ts_cache
+            sec = int(record["time"].timestamp())
+            cached_sec, ts = _ts_cache
+            if sec != cached_sec:
+                ts = record["time"].strftime("%Y-%m-%d %H:%M:%S")
+                _ts_cache = (sec, ts)
 
             # 构造日志内容
-            log_content = (
-                f"{record['time'].strftime('%Y-%m-%d %H:%M:%S')} - {record['name']} - "
-                f"{level} - {record['message']}"
-            )
+            log_content = f"{ts} - {record['name']} - {level} - {record['message']}"
 
             # WARNING/ERROR 整行染色，其他级别仅级别名染色
             if level in ["WARNING", "ERROR"]:
@@ -162,17 +145,14 @@ class LogManager:
                 return f"{color}{log_content}{reset}\n"
             else:
                 # 仅级别名染色
-                return (
-                    f"{record['time'].strftime('%Y-%m-%d %H:%M:%S')} - {record['name']} - "
-                    f"{color}{level}{reset} - {record['message']}\n"
-                )
+                return f"{ts} - {record['name']} - {color}{level}{reset} - {record['message']}\n"
 
         # 添加新的控制台handler
         self.console_handler_id = log.add(
             sink=lambda msg: print(msg, end=""),  # 控制台输出
             level=self.run_mode, # 控制台输出级别
             format=colored_format,
-            filter=lambda record: record["extra"].get("category") == self.category
+            enqueue=True  # 后台线程打印，推理循环不阻塞在终端输出上
         )
 
     # ========== 对外暴露的核心接口 ==========
@@ -189,7 +169,7 @@ class LogManager:
 
         # 2. 如果级别未变化，无需处理
         if self.run_mode == level:
-            log.bind(category=self.category).info(f"控制台日志级别已为 {level}，无需修改")
+            self._log.info(f"控制台日志级别已为 {level}，无需修改")
             return
 
         # 3. 更新运行模式
@@ -198,25 +178,33 @@ class LogManager:
         self._config_console_handler()
 
         # 日志记录级别变更
-        log.bind(category=self.category).info(
+        self._log.info(
             f"控制台日志级别已更新为：{level}（控制台不打印该级别以下的日志，但所有级别日志仍保存到本地）"
         )
 
     def debug(self, msg):
         """DEBUG 日志：始终保存到文件，仅当控制台级别为DEBUG时打印"""
-        log.bind(category=self.category).debug(msg)
+        self._log.debug(msg)
+
+    def debug_lazy(self, fn):
+        """DEBUG 日志（惰性）：fn 为返回日志内容的无参函数，只有存在接收 DEBUG 的输出时才会调用"""
+        self._log.opt(lazy=True).debug("{}", fn)
 
     def info(self, msg):
         """INFO 日志：始终保存到文件，仅当控制台级别≤INFO时打印"""
-        log.bind(category=self.category).info(msg)
+        self._log.info(msg)
 
     def warning(self, msg):
         """WARNING 日志：始终保存到文件，仅当控制台级别≤WARNING时打印"""
-        log.bind(category=self.category).warning(msg)
+        self._log.warning(msg)
 
     def error(self, msg):
         """ERROR 日志：始终保存到文件+打印到控制台（最高级别）"""
-        log.bind(category=self.category).error(msg)
+        self._log.error(msg)
+
+    def complete(self):
+        """等待队列中尚未写出的日志全部输出（enqueue 模式下退出前调用）"""
+        log.complete()
 
     def get_current_level(self):
         """获取当前控制台输出级别"""
@@ -257,5 +245,5 @@ if __name__ == "__main__":
     # log_manager.warning("这是WARNING日志（保存+不打印）")
     # log_manager.error("这是ERROR日志（保存+打印）")
     #
-    # # 验证文件保存：可以查看 ./logs/YYYY-MM-DD/TEST_*.log 文件，所有日志都已保存
+    # # 验证文件保存：可以查看 ./logs/YYYY-MM-DD/TEST_debug_*.log 文件，所有日志都已保存
     # print("\n提示：所有级别日志已保存到 ./logs 目录下，仅控制台输出按级别过滤！")
\ No newline at end of file